@@ -1,12 +1,101 @@
+import io
 import os
 import time
+import numpy as np
 import pandas as pd
 import psycopg2
-from psycopg2.extras import execute_values
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.feather as feather
 
 CSV_PATH = os.getenv("CSV_PATH", "/data/paysim_small.csv")
 MAX_ROWS = int(os.getenv("MAX_ROWS", "50000"))
 
+TRUE_STRINGS = np.array(["1", "true", "t", "yes", "y"])
+
+# Read-path structures for the MCP server (idempotent: also applied when the load is skipped).
+POST_LOAD_SQL = [
+    # Volumes created before tx_type existed still have type TEXT: convert once (table rewrite).
+    """
+    DO $$
+    BEGIN
+      IF NOT EXISTS (SELECT 1 FROM pg_type WHERE typname = 'tx_type') THEN
+        CREATE TYPE tx_type AS ENUM ('TRANSFER', 'CASH_OUT', 'PAYMENT', 'DEBIT', 'CASH_IN');
+      END IF;
+      IF (SELECT data_type FROM information_schema.columns
+          WHERE table_name = 'transactions' AND column_name = 'type') = 'text' THEN
+        ALTER TABLE transactions ALTER COLUMN type TYPE tx_type USING type::tx_type;
+      END IF;
+    END $$;
+    """,
+    # Composite indexes: account lookups filtered on step become index-only range scans.
+    # type is included for the per-account type breakdown and the TRANSFER/CASH_OUT stats.
+    "CREATE INDEX IF NOT EXISTS ix_tx_orig_step_cov ON transactions (name_orig, step) INCLUDE (amount, type, is_fraud);",
+    "CREATE INDEX IF NOT EXISTS ix_tx_dest_step ON transactions (name_dest, step) INCLUDE (amount);",
+    # Superseded by the composite indexes above (older volumes created them in schema.sql).
+    "DROP INDEX IF EXISTS idx_tx_name_orig;",
+    "DROP INDEX IF EXISTS idx_tx_name_dest;",
+    "DROP INDEX IF EXISTS ix_tx_orig_step;",
+    # Per-account totals for resources/read account/<name>: one index lookup per call.
+    """
+    CREATE MATERIALIZED VIEW IF NOT EXISTS account_kpi AS
+    SELECT
+      name,
+      COUNT(*) FILTER (WHERE dir='out') AS nb_out,
+      COALESCE(SUM(amount) FILTER (WHERE dir='out'), 0) AS total_out,
+      COUNT(*) FILTER (WHERE dir='in') AS nb_in,
+      COALESCE(SUM(amount) FILTER (WHERE dir='in'), 0) AS total_in,
+      COUNT(*) FILTER (WHERE dir='out' AND is_fraud) AS fraud_out
+    FROM (
+      SELECT name_orig AS name, 'out' AS dir, amount, is_fraud FROM transactions
+      UNION ALL
+      SELECT name_dest AS name, 'in' AS dir, amount, FALSE FROM transactions
+    ) t
+    GROUP BY name;
+    """,
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_account_kpi_name ON account_kpi (name);",
+    # Per-account outgoing stats behind the UI's detection auto-tune and no-match diagnostic.
+    """
+    CREATE MATERIALIZED VIEW IF NOT EXISTS account_suggestions AS
+    SELECT
+      name_orig AS name,
+      COUNT(*)::int AS nb_out,
+      AVG(amount)::float8 AS avg_amt,
+      MAX(amount)::float8 AS max_amt,
+      MIN(step)::int AS step_min,
+      MAX(step)::int AS step_max,
+      (percentile_disc(0.95) WITHIN GROUP (ORDER BY amount))::float8 AS p95,
+      COUNT(*) FILTER (WHERE type IN ('TRANSFER', 'CASH_OUT'))::int AS nb_risky_out,
+      COALESCE(MAX(amount) FILTER (WHERE type IN ('TRANSFER', 'CASH_OUT')), 0)::float8 AS max_risky_amount,
+      COALESCE(percentile_disc(0.95) WITHIN GROUP (ORDER BY amount)
+               FILTER (WHERE type IN ('TRANSFER', 'CASH_OUT')), 0)::float8 AS p95_risky_amount
+    FROM transactions
+    GROUP BY name_orig;
+    """,
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_account_suggestions_name ON account_suggestions (name);",
+    # Global counters + type breakdown for the UI overview (tiny rows instead of full scans).
+    """
+    CREATE MATERIALIZED VIEW IF NOT EXISTS transactions_overview_mv AS
+    SELECT
+      COUNT(*) AS n,
+      COUNT(*) FILTER (WHERE is_fraud) AS n_fraud,
+      MIN(step) AS step_min,
+      MAX(step) AS step_max
+    FROM transactions;
+    """,
+    """
+    CREATE MATERIALIZED VIEW IF NOT EXISTS transactions_types_mv AS
+    SELECT type, COUNT(*) AS cnt
+    FROM transactions
+    GROUP BY type;
+    """,
+    "ANALYZE;",
+]
+
+# Views built from transactions by POST_LOAD_SQL: CREATE ... IF NOT EXISTS keeps an existing
+# view's old content, so a fresh load refreshes them.
+MATERIALIZED_VIEWS = ["account_kpi", "account_suggestions", "transactions_overview_mv", "transactions_types_mv"]
+
 DB_HOST = os.getenv("DB_HOST", "db")   # docker service name
 DB_PORT = int(os.getenv("DB_PORT", "5432"))
 DB_NAME = os.getenv("DB_NAME", "paysim")
@@ -28,6 +117,85 @@ def connect_with_retry(max_wait_s: int = 90):
     raise RuntimeError(f"DB not reachable after {max_wait_s}s (host={DB_HOST}): {last_err}")
 
 
+def read_csv_head(path: str, max_rows: int, usecols=None, column_types=None) -> pd.DataFrame:
+    """Read the first `max_rows` rows with Arrow's multithreaded CSV reader.
+
+    Batches are streamed so we stop parsing once `max_rows` is reached; columns stay
+    Arrow-backed in pandas (no per-cell Python objects for strings).
+    """
+    reader = pacsv.open_csv(
+        path,
+        read_options=pacsv.ReadOptions(block_size=8 << 20),
+        convert_options=pacsv.ConvertOptions(
+            include_columns=usecols or [],
+            column_types=column_types or {},
+        ),
+    )
+    batches = []
+    n = 0
+    for batch in reader:
+        batches.append(batch)
+        n += batch.num_rows
+        if n >= max_rows:
+            break
+    table = pa.Table.from_batches(batches, schema=reader.schema).slice(0, max_rows)
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def read_feather_head(path: str, max_rows: int) -> pd.DataFrame:
+    """Read the first `max_rows` rows of a Feather file written by reduce_paysim.py (no CSV parsing)."""
+    table = feather.read_table(path, memory_map=True).slice(0, max_rows)
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def apply_post_load(cur) -> None:
+    for sql in POST_LOAD_SQL:
+        cur.execute(sql)
+
+
+def refresh_materialized_views(cur) -> None:
+    """Recompute the views that already exist (missing ones are created by apply_post_load)."""
+    cur.execute("SELECT matviewname FROM pg_matviews WHERE matviewname = ANY(%s);", (MATERIALIZED_VIEWS,))
+    for (name,) in cur.fetchall():
+        cur.execute(f"REFRESH MATERIALIZED VIEW {name};")
+
+
+class FrameCsvStream:
+    """Read-only file object serializing a DataFrame to CSV `chunk_rows` rows at a time.
+
+    Handed to `copy_expert`, it lets COPY consume the frame without ever building the
+    full CSV text (or a list of row tuples) in memory. Chunks are encoded by Arrow's
+    native CSV writer straight from the column buffers (no per-cell Python formatting).
+    """
+
+    def __init__(self, df: pd.DataFrame, chunk_rows: int = 5000):
+        self._table = pa.Table.from_pandas(df, preserve_index=False)
+        self._chunk_rows = chunk_rows
+        self._pos = 0
+        self._cur = io.BytesIO()
+        self._write_options = pacsv.WriteOptions(include_header=False)
+
+    def _next_chunk(self) -> bool:
+        if self._pos >= self._table.num_rows:
+            return False
+        self._cur = io.BytesIO()
+        pacsv.write_csv(self._table.slice(self._pos, self._chunk_rows), self._cur, self._write_options)
+        self._cur.seek(0)
+        self._pos += self._chunk_rows
+        return True
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            parts = [self._cur.read()]
+            while self._next_chunk():
+                parts.append(self._cur.read())
+            return b"".join(parts)
+        data = self._cur.read(size)
+        while not data and self._next_chunk():
+            data = self._cur.read(size)
+        return data
+
+
 def main():
     print("Loading CSV subset...")
     print(f"CSV_PATH resolved to: {CSV_PATH}")
@@ -40,42 +208,45 @@ def main():
         ["step","type","amount","name_orig","oldbalance_org","newbalance_org","name_dest","oldbalance_dest","newbalance_dest","is_fraud","is_flagged_fraud"],
     ]
 
-    dtype_guess = {
-        "step": "int64",
-        "type": "string",
-        "amount": "float64",
-        "nameOrig": "string",
-        "nameDest": "string",
-        "name_orig": "string",
-        "name_dest": "string",
-        "oldbalanceOrg": "float64",
-        "newbalanceOrig": "float64",
-        "oldbalanceDest": "float64",
-        "newbalanceDest": "float64",
-        "oldbalance_org": "float64",
-        "newbalance_org": "float64",
-        "oldbalance_dest": "float64",
-        "newbalance_dest": "float64",
-        "isFraud": "int64",
-        "isFlaggedFraud": "int64",
-        "is_fraud": "int64",
-        "is_flagged_fraud": "int64",
+    column_types = {
+        "step": pa.int64(),
+        "type": pa.dictionary(pa.int32(), pa.string()),
+        "amount": pa.float64(),
+        "nameOrig": pa.string(),
+        "nameDest": pa.string(),
+        "name_orig": pa.string(),
+        "name_dest": pa.string(),
+        "oldbalanceOrg": pa.float64(),
+        "newbalanceOrig": pa.float64(),
+        "oldbalanceDest": pa.float64(),
+        "newbalanceDest": pa.float64(),
+        "oldbalance_org": pa.float64(),
+        "newbalance_org": pa.float64(),
+        "oldbalance_dest": pa.float64(),
+        "newbalance_dest": pa.float64(),
+        "isFraud": pa.int64(),
+        "isFlaggedFraud": pa.int64(),
+        "is_fraud": pa.int64(),
+        "is_flagged_fraud": pa.int64(),
     }
 
     df = None
     last_err = None
-    for usecols in preferred_cols_sets:
-        try:
-            df = pd.read_csv(CSV_PATH, nrows=MAX_ROWS, usecols=usecols, dtype={k: v for k, v in dtype_guess.items() if k in usecols})
-            break
-        except Exception as e:
-            last_err = e
-            df = None
+    if CSV_PATH.endswith(".feather"):
+        df = read_feather_head(CSV_PATH, MAX_ROWS)
+    else:
+        for usecols in preferred_cols_sets:
+            try:
+                df = read_csv_head(CSV_PATH, MAX_ROWS, usecols=usecols, column_types={k: v for k, v in column_types.items() if k in usecols})
+                break
+            except Exception as e:
+                last_err = e
+                df = None
 
-    if df is None:
-        # Fall back to reading without usecols (handles unexpected column layouts)
-        print(f"WARN: could not read with predefined columns (will fallback). Reason: {last_err}")
-        df = pd.read_csv(CSV_PATH, nrows=MAX_ROWS)
+        if df is None:
+            # Fall back to reading without usecols (handles unexpected column layouts)
+            print(f"WARN: could not read with predefined columns (will fallback). Reason: {last_err}")
+            df = read_csv_head(CSV_PATH, MAX_ROWS)
 
     # Normalize column names to snake_case (no-op if already normalized)
     df = df.rename(
@@ -103,12 +274,14 @@ def main():
         raise RuntimeError(f"CSV missing columns: {missing}. Found: {list(df.columns)}")
 
     def _to_bool(s: pd.Series) -> pd.Series:
-        # Accept 0/1, True/False, and string variants.
-        if s.dtype == bool:
+        # Accept 0/1, True/False, and string variants (single pass over the column buffer).
+        if pd.api.types.is_bool_dtype(s):
             return s
-        if str(s.dtype).startswith("int") or str(s.dtype).startswith("float"):
-            return s.fillna(0).astype(int).astype(bool)
-        return s.astype(str).str.lower().isin(["1", "true", "t", "yes", "y"])
+        if pd.api.types.is_numeric_dtype(s):
+            values = s.to_numpy(dtype=np.int64, na_value=0).astype(bool)
+        else:
+            values = np.isin(np.char.lower(s.to_numpy(dtype=str, na_value="")), TRUE_STRINGS)
+        return pd.Series(values, index=s.index)
 
     df["is_fraud"] = _to_bool(df["is_fraud"])
     df["is_flagged_fraud"] = _to_bool(df["is_flagged_fraud"])
@@ -124,27 +297,27 @@ def main():
     existing = cur.fetchone()[0]
     if existing and existing > 0:
         print(f"Table already has {existing} rows. Skipping load.")
+        apply_post_load(cur)
         conn.commit()
         cur.close()
         conn.close()
         print("DONE")
         return
 
-    print("Inserting rows into Postgres (bulk)...")
-    rows = [tuple(x) for x in df[cols].to_numpy()]
-
-    execute_values(
-        cur,
-        """
-        INSERT INTO transactions (
-            step,type,amount,name_orig,oldbalance_org,newbalance_org,
-            name_dest,oldbalance_dest,newbalance_dest,is_fraud,is_flagged_fraud
-        ) VALUES %s
-        """,
-        rows,
-        page_size=5000,
+    print("Inserting rows into Postgres (COPY)...")
+    # COPY is parsed server-side in one stream: no per-row SQL, no Python tuples.
+    # Text CSV rather than FORMAT BINARY: amount/balances are NUMERIC, whose binary wire
+    # format (base-10000 digit groups) would need per-value Python packing.
+    cur.copy_expert(
+        f"COPY transactions ({','.join(cols)}) FROM STDIN WITH (FORMAT CSV)",
+        FrameCsvStream(df[cols]),
     )
     conn.commit()
+
+    print("Building indexes...")
+    refresh_materialized_views(cur)
+    apply_post_load(cur)
+    conn.commit()
     cur.close()
     conn.close()
     print("DONE")
@@ -1,33 +1,50 @@
-import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.feather as feather
 
 INPUT = "data/raw/paysim.csv"
-OUTPUT = "data/raw/paysim_small.csv"
+OUTPUT = "data/raw/paysim_small.feather"
 
-CHUNK_SIZE = 200_000
+BATCH_SIZE = 200_000
 MAX_ROWS = 50_000
 
-rows = []
-
-for chunk in pd.read_csv(INPUT, chunksize=CHUNK_SIZE):
-    # On garde :
-    # - montants élevés
-    # - fraudes
-    # - types intéressants
-    filtered = chunk[
-        (chunk["amount"] > 100_000)
-        | (chunk["isFraud"] == 1)
-        | (chunk["type"].isin(["TRANSFER", "CASH_OUT"]))
-    ]
-
-    rows.append(filtered)
-
-    if sum(len(r) for r in rows) >= MAX_ROWS:
+COLUMNS = [
+    "step", "type", "amount",
+    "nameOrig", "oldbalanceOrg", "newbalanceOrig",
+    "nameDest", "oldbalanceDest", "newbalanceDest",
+    "isFraud", "isFlaggedFraud",
+]
+
+# On garde :
+# - montants élevés
+# - fraudes
+# - types intéressants
+# Le filtre est évalué par le scanner Arrow (vectorisé), pas en pandas.
+keep = (
+    (ds.field("amount") > 100_000)
+    | (ds.field("isFraud") == 1)
+    | ds.field("type").isin(["TRANSFER", "CASH_OUT"])
+)
+
+scanner = ds.dataset(INPUT, format="csv").scanner(columns=COLUMNS, filter=keep, batch_size=BATCH_SIZE)
+
+batches = []
+n = 0
+for batch in scanner.to_batches():
+    if batch.num_rows == 0:
+        continue
+    batches.append(batch)
+    n += batch.num_rows
+    if n >= MAX_ROWS:
         break
 
-df = pd.concat(rows).head(MAX_ROWS)
+table = pa.Table.from_batches(batches, schema=scanner.projected_schema).slice(0, MAX_ROWS)
 
-df.to_csv(OUTPUT, index=False)
+# Feather (Arrow IPC) : le loader relit les colonnes typées sans re-parser de CSV.
+feather.write_feather(table, OUTPUT, compression="zstd")
 
 print(f"✅ Fichier réduit créé : {OUTPUT}")
-print(f"➡️ {len(df)} lignes")
-print(df[["type", "amount", "isFraud"]].value_counts().head())
\ No newline at end of file
+print(f"➡️ {table.num_rows} lignes")
+counts = table.group_by(["type", "isFraud"]).aggregate([([], "count_all")]).sort_by([("count_all", "descending")])
+for row in counts.slice(0, 5).to_pylist():
+    print(f"   {row['type']:<9} isFraud={row['isFraud']} : {row['count_all']}")
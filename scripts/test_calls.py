@@ -1,10 +1,10 @@
+import http.client
 import json
 import os
 import subprocess
 import sys
 import time
-import urllib.request
-import urllib.error
+from urllib.parse import urlsplit
 
 import psycopg2
 
@@ -78,35 +78,24 @@ def pick_demo_values(wait_s: int = 120):
             "  docker compose up -d\n"
         )
 
-    cur.execute("SELECT MIN(id) FROM transactions;")
-    tx_id = cur.fetchone()[0]
-    if tx_id is None:
-        cur.close()
-        conn.close()
-        raise RuntimeError("Aucun id trouvé dans transactions (table vide ou chargement incomplet).")
-
+    # One round-trip: first id + busiest sender (falls back to any receiver name).
     cur.execute(
         """
-        SELECT name_orig
-        FROM transactions
-        WHERE name_orig IS NOT NULL AND name_orig <> ''
-        GROUP BY name_orig
-        ORDER BY COUNT(*) DESC
-        LIMIT 1;
+        SELECT
+          MIN(id),
+          COALESCE(
+            (SELECT name_orig FROM transactions WHERE name_orig <> ''
+             GROUP BY name_orig ORDER BY COUNT(*) DESC LIMIT 1),
+            (SELECT name_dest FROM transactions WHERE name_dest <> '' LIMIT 1)
+          )
+        FROM transactions;
         """
     )
-    row = cur.fetchone()
-    name = row[0] if row else None
-
-    if not name:
-        cur.execute("SELECT name_orig FROM transactions WHERE name_orig IS NOT NULL AND name_orig <> '' LIMIT 1;")
-        row = cur.fetchone()
-        name = row[0] if row else None
-
-    if not name:
-        cur.execute("SELECT name_dest FROM transactions WHERE name_dest IS NOT NULL AND name_dest <> '' LIMIT 1;")
-        row = cur.fetchone()
-        name = row[0] if row else None
+    tx_id, name = cur.fetchone()
+    if tx_id is None:
+        cur.close()
+        conn.close()
+        raise RuntimeError("Aucun id trouvé dans transactions (table vide ou chargement incomplet).")
 
     cur.close()
     conn.close()
@@ -114,23 +103,32 @@ def pick_demo_values(wait_s: int = 120):
 
 
 class HttpMcpClient:
+    """JSON-RPC over one keep-alive HTTP connection (reopened on failure)."""
+
     def __init__(self, url: str):
         self.url = url
+        parts = urlsplit(url)
+        self._host = parts.hostname
+        self._port = parts.port or 80
+        self._path = parts.path or "/"
+        self._conn = None
         self._id = 0
 
     def call(self, method: str, params: dict):
         self._id += 1
         payload = {"jsonrpc": "2.0", "id": self._id, "method": method, "params": params or {}}
         data = json.dumps(payload).encode("utf-8")
-        req = urllib.request.Request(self.url, data=data, headers={"Content-Type": "application/json"})
         last_err = None
         for _ in range(20):
             try:
-                with urllib.request.urlopen(req, timeout=5) as resp:
-                    raw = resp.read().decode("utf-8")
+                if self._conn is None:
+                    self._conn = http.client.HTTPConnection(self._host, self._port, timeout=5)
+                self._conn.request("POST", self._path, body=data, headers={"Content-Type": "application/json"})
+                raw = self._conn.getresponse().read().decode("utf-8")
                 return json.loads(raw)
-            except (urllib.error.URLError, ConnectionResetError, TimeoutError) as e:
+            except (OSError, http.client.HTTPException) as e:
                 last_err = e
+                self.close()
                 time.sleep(0.5)
 
         raise RuntimeError(
@@ -141,6 +139,11 @@ class HttpMcpClient:
             "  docker logs paysim_mcp_server\n"
         )
 
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
 
 class StdioMcpClient:
     def __init__(self, cmd):
@@ -201,8 +204,7 @@ def main():
         )
     )
 
-    if not use_http:
-        p.close()
+    p.close()
 
 
 if __name__ == "__main__":
@@ -1,10 +1,20 @@
+import itertools
 import json
 import os
+import threading
 import time
+from contextlib import contextmanager
 from decimal import Decimal
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+
+try:
+    import orjson
+except ImportError:  # stdlib fallback, e.g. when running the server outside the container
+    orjson = None
 
 
 DB_HOST = os.getenv("DB_HOST", "db")
@@ -12,6 +22,17 @@ DB_PORT = int(os.getenv("DB_PORT", "5432"))
 DB_NAME = os.getenv("DB_NAME", "paysim")
 DB_USER = os.getenv("DB_USER", "paysim")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "paysim")
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "5"))
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "4"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "32"))
+
+# Responses are deterministic for the loaded sample; 0 disables the cache.
+CACHE_TTL_S = float(os.getenv("MCP_CACHE_TTL_S", "60"))
+CACHE_MAXSIZE = int(os.getenv("MCP_CACHE_MAXSIZE", "4096"))
+# detect_suspicious reads an in-memory copy of risky outgoing rows, rebuilt after this many
+# seconds; 0 queries Postgres on every call instead.
+SNAPSHOT_TTL_S = float(os.getenv("MCP_SNAPSHOT_TTL_S", "300"))
 
 HOST = os.getenv("MCP_HTTP_HOST", "0.0.0.0")
 PORT = int(os.getenv("MCP_HTTP_PORT", "8765"))
@@ -47,10 +68,159 @@ TOOLS = [
 ]
 
 
+# Hot queries are parsed/planned once per pooled connection, then run with EXECUTE.
+PREPARED_STATEMENTS = {
+    # account_kpi is a materialized view built by the loader (one row per account).
+    "account_summary": (
+        "text",
+        """
+        SELECT nb_out, total_out, nb_in, total_in, fraud_out
+        FROM account_kpi
+        WHERE name=$1
+        """,
+    ),
+    "tx_get": (
+        "bigint",
+        """
+        SELECT
+          id,
+          step,
+          type,
+          amount::float8 AS amount,
+          name_orig,
+          oldbalance_org::float8 AS oldbalance_org,
+          newbalance_org::float8 AS newbalance_org,
+          name_dest,
+          oldbalance_dest::float8 AS oldbalance_dest,
+          newbalance_dest::float8 AS newbalance_dest,
+          is_fraud,
+          is_flagged_fraud
+        FROM transactions
+        WHERE id=$1
+        """,
+    ),
+    # Aggregates + top types in one round-trip, sharing the filtered row set.
+    "account_kpi": (
+        "text, integer, integer",
+        """
+        WITH t AS (
+          SELECT 'out' AS dir, type, amount, is_fraud FROM transactions WHERE name_orig=$1 AND step BETWEEN $2 AND $3
+          UNION ALL
+          SELECT 'in' AS dir, NULL, amount, FALSE FROM transactions WHERE name_dest=$1 AND step BETWEEN $2 AND $3
+        )
+        SELECT
+          COUNT(*) FILTER (WHERE dir='out') AS nb_out,
+          COALESCE(SUM(amount) FILTER (WHERE dir='out'),0) AS total_out,
+          COUNT(*) FILTER (WHERE dir='in') AS nb_in,
+          COALESCE(SUM(amount) FILTER (WHERE dir='in'),0) AS total_in,
+          COUNT(*) FILTER (WHERE dir='out' AND is_fraud) AS fraud_out,
+          (
+            SELECT COALESCE(json_agg(json_build_object('type', type, 'cnt', cnt) ORDER BY cnt DESC), '[]'::json)
+            FROM (
+              SELECT type, COUNT(*) AS cnt
+              FROM t
+              WHERE dir='out'
+              GROUP BY type
+              ORDER BY cnt DESC
+              LIMIT 5
+            ) tt
+          ) AS top_types
+        FROM t
+        """,
+    ),
+    "tx_suspicious": (
+        "text, numeric, integer",
+        """
+        SELECT id, step, type, amount, name_orig, name_dest, is_fraud
+        FROM transactions
+        WHERE name_orig=$1
+          AND amount >= $2
+          AND type IN ('TRANSFER','CASH_OUT')
+        ORDER BY amount DESC
+        LIMIT $3
+        """,
+    ),
+}
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    # Set once PREPARED_STATEMENTS exist in this session.
+    prepared = False
+
+
+def prepare_statements(conn) -> None:
+    # Sent as one multi-statement batch: a single round-trip per new connection.
+    batch = ";".join(f"PREPARE {name} ({argtypes}) AS {sql}" for name, (argtypes, sql) in PREPARED_STATEMENTS.items())
+    with conn.cursor() as cur:
+        cur.execute(batch)
+    conn.commit()
+    conn.prepared = True
+
+
+_pool = None
+_pool_lock = threading.Lock()
+# One handler thread per request: threads beyond DB_POOL_MAX wait for a connection
+# instead of failing with "connection pool exhausted".
+_pool_slots = threading.BoundedSemaphore(DB_POOL_MAX)
+
+
+def get_pool():
+    # Created lazily so the server can start before Postgres accepts connections.
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = psycopg2.pool.ThreadedConnectionPool(
+                    DB_POOL_MIN,
+                    DB_POOL_MAX,
+                    host=DB_HOST,
+                    port=DB_PORT,
+                    dbname=DB_NAME,
+                    user=DB_USER,
+                    password=DB_PASSWORD,
+                    connect_timeout=DB_CONNECT_TIMEOUT,
+                    options=f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}",
+                    connection_factory=PooledConnection,
+                )
+    return _pool
+
+
+@contextmanager
 def db_conn():
-    return psycopg2.connect(
-        host=DB_HOST, port=DB_PORT, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD
-    )
+    """Borrow a pooled connection (thread-safe); the transaction ends when the block exits."""
+    pool = get_pool()
+    with _pool_slots:
+        conn = pool.getconn()
+        try:
+            if not conn.prepared:
+                prepare_statements(conn)
+            with conn:
+                yield conn
+        finally:
+            # Drop connections that died (e.g. Postgres restart) instead of handing them out again.
+            pool.putconn(conn, close=bool(conn.closed))
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def cache_get(key):
+    with _cache_lock:
+        hit = _cache.get(key)
+    if hit is None or hit[0] < time.monotonic():
+        return None
+    return hit[1]
+
+
+def cache_put(key, value):
+    if CACHE_TTL_S <= 0:
+        return value
+    with _cache_lock:
+        if key not in _cache and len(_cache) >= CACHE_MAXSIZE:
+            _cache.pop(next(iter(_cache)))  # oldest entry first
+        _cache[key] = (time.monotonic() + CACHE_TTL_S, value)
+    return value
 
 
 def jsonrpc_ok(_id, result):
@@ -62,22 +232,20 @@ def jsonrpc_err(_id, code, message):
 
 
 def resource_read(uri: str):
+    key = ("resource", uri)
+    cached = cache_get(key)
+    if cached is not None:
+        return cached
+    return cache_put(key, _resource_read(uri))
+
+
+def _resource_read(uri: str):
     if uri.startswith("account/"):
         name = uri.split("/", 1)[1]
         with db_conn() as conn, conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT
-                  COUNT(*) FILTER (WHERE name_orig=%s) AS nb_out,
-                  COALESCE(SUM(amount) FILTER (WHERE name_orig=%s), 0) AS total_out,
-                  COUNT(*) FILTER (WHERE name_dest=%s) AS nb_in,
-                  COALESCE(SUM(amount) FILTER (WHERE name_dest=%s), 0) AS total_in,
-                  COUNT(*) FILTER (WHERE name_orig=%s AND is_fraud) AS fraud_out
-                FROM transactions
-                """,
-                (name, name, name, name, name),
-            )
-            nb_out, total_out, nb_in, total_in, fraud_out = cur.fetchone()
+            cur.execute("EXECUTE account_summary (%s)", (name,))
+            row = cur.fetchone()
+        nb_out, total_out, nb_in, total_in, fraud_out = row or (0, 0, 0, 0, 0)
         return {
             "name": name,
             "nb_out": int(nb_out),
@@ -90,26 +258,7 @@ def resource_read(uri: str):
     if uri.startswith("transaction/"):
         tx_id = int(uri.split("/", 1)[1])
         with db_conn() as conn, conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT
-                  id,
-                  step,
-                  type,
-                  amount::float8 AS amount,
-                  name_orig,
-                  oldbalance_org::float8 AS oldbalance_org,
-                  newbalance_org::float8 AS newbalance_org,
-                  name_dest,
-                  oldbalance_dest::float8 AS oldbalance_dest,
-                  newbalance_dest::float8 AS newbalance_dest,
-                  is_fraud,
-                  is_flagged_fraud
-                FROM transactions
-                WHERE id=%s
-                """,
-                (tx_id,),
-            )
+            cur.execute("EXECUTE tx_get (%s)", (tx_id,))
             row = cur.fetchone()
             if not row:
                 return {"id": tx_id, "found": False}
@@ -125,78 +274,80 @@ def tool_get_account_kpi(name: str, step_from=None, step_to=None):
     step_from = int(step_from) if step_from is not None else 1
     step_to = int(step_to) if step_to is not None else 200
 
+    key = ("kpi", name, step_from, step_to)
+    cached = cache_get(key)
+    if cached is not None:
+        return cached
+
     with db_conn() as conn, conn.cursor() as cur:
-        cur.execute(
-            """
-            SELECT
-              COUNT(*) FILTER (WHERE name_orig=%s AND step BETWEEN %s AND %s) AS nb_out,
-              COALESCE(SUM(amount) FILTER (WHERE name_orig=%s AND step BETWEEN %s AND %s),0) AS total_out,
-              COUNT(*) FILTER (WHERE name_dest=%s AND step BETWEEN %s AND %s) AS nb_in,
-              COALESCE(SUM(amount) FILTER (WHERE name_dest=%s AND step BETWEEN %s AND %s),0) AS total_in,
-              COUNT(*) FILTER (WHERE name_orig=%s AND is_fraud AND step BETWEEN %s AND %s) AS fraud_out
-            FROM transactions
-            """,
-            (name, step_from, step_to, name, step_from, step_to, name, step_from, step_to, name, step_from, step_to, name, step_from, step_to),
-        )
-        nb_out, total_out, nb_in, total_in, fraud_out = cur.fetchone()
-
-        cur.execute(
-            """
-            SELECT type, COUNT(*) as cnt
-            FROM transactions
-            WHERE name_orig=%s AND step BETWEEN %s AND %s
-            GROUP BY type
-            ORDER BY cnt DESC
-            LIMIT 5
-            """,
-            (name, step_from, step_to),
-        )
-        top_types = [{"type": t, "cnt": int(c)} for (t, c) in cur.fetchall()]
+        cur.execute("EXECUTE account_kpi (%s, %s, %s)", (name, step_from, step_to))
+        nb_out, total_out, nb_in, total_in, fraud_out, top_types = cur.fetchone()
+
+    top_types = [{"type": x["type"], "cnt": int(x["cnt"])} for x in top_types]
 
     avg_out = (float(total_out) / int(nb_out)) if nb_out else 0.0
     avg_in = (float(total_in) / int(nb_in)) if nb_in else 0.0
 
-    return {
+    return cache_put(key, {
         "name": name,
         "step_from": step_from,
         "step_to": step_to,
         "out": {"nb_out": int(nb_out), "total_out": float(total_out), "avg_out_amount": avg_out, "fraud_out": int(fraud_out)},
         "in": {"nb_in": int(nb_in), "total_in": float(total_in), "avg_in_amount": avg_in},
         "top_out_types": top_types,
+    })
+
+
+def _match_row(r):
+    return {
+        "id": int(r[0]),
+        "step": int(r[1]),
+        "type": r[2],
+        "amount": float(r[3]),
+        "name_orig": r[4],
+        "name_dest": r[5],
+        "is_fraud": bool(r[6]),
     }
 
 
+_snapshot = None
+_snapshot_lock = threading.Lock()
+
+
+def risky_out_snapshot():
+    """Outgoing TRANSFER/CASH_OUT rows per name_orig, sorted by amount desc (rebuilt every SNAPSHOT_TTL_S)."""
+    global _snapshot
+    with _snapshot_lock:
+        if _snapshot is None or _snapshot[0] < time.monotonic():
+            by_name = {}
+            with db_conn() as conn, conn.cursor() as cur:
+                cur.execute(
+                    """
+                    SELECT id, step, type, amount::float8, name_orig, name_dest, is_fraud
+                    FROM transactions
+                    WHERE type IN ('TRANSFER','CASH_OUT')
+                    ORDER BY name_orig, amount DESC
+                    """
+                )
+                for r in cur:
+                    by_name.setdefault(r[4], []).append(_match_row(r))
+            _snapshot = (time.monotonic() + SNAPSHOT_TTL_S, by_name)
+        return _snapshot[1]
+
+
 def tool_detect_suspicious(name: str, min_amount=200000, window_steps=10, max_rows=10):
     min_amount = float(min_amount) if min_amount is not None else 200000.0
     window_steps = int(window_steps) if window_steps is not None else 10
     max_rows = int(max_rows) if max_rows is not None else 10
 
-    with db_conn() as conn, conn.cursor() as cur:
-        cur.execute(
-            """
-            SELECT id, step, type, amount, name_orig, name_dest, is_fraud
-            FROM transactions
-            WHERE name_orig=%s
-              AND amount >= %s
-              AND type IN ('TRANSFER','CASH_OUT')
-            ORDER BY amount DESC
-            LIMIT %s
-            """,
-            (name, min_amount, max_rows),
-        )
-        rows = cur.fetchall()
-
-    matches = []
-    for r in rows:
-        matches.append({
-            "id": int(r[0]),
-            "step": int(r[1]),
-            "type": r[2],
-            "amount": float(r[3]),
-            "name_orig": r[4],
-            "name_dest": r[5],
-            "is_fraud": bool(r[6]),
-        })
+    if SNAPSHOT_TTL_S > 0:
+        # Rows are sorted by amount desc: matches are the leading rows >= min_amount.
+        rows = risky_out_snapshot().get(name, [])
+        matches = list(itertools.islice(itertools.takewhile(lambda m: m["amount"] >= min_amount, rows), max_rows))
+    else:
+        with db_conn() as conn, conn.cursor() as cur:
+            cur.execute("EXECUTE tx_suspicious (%s, %s, %s)", (name, min_amount, max_rows))
+            matches = [_match_row(r) for r in cur.fetchall()]
 
     return {
         "name": name,
@@ -208,6 +359,100 @@ def tool_detect_suspicious(name: str, min_amount=200000, window_steps=10, max_ro
     }
 
 
+class RpcError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+
+
+def rpc_initialize(params):
+    return {"server": "mcp-paysim-demo", "version": "0.1", "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def rpc_tools_list(params):
+    return {"tools": TOOLS}
+
+
+def rpc_resources_read(params):
+    uri = params.get("uri") or params.get("resource")
+    if not uri:
+        raise RpcError(-32602, "missing uri")
+    out = resource_read(uri)
+    context = params.get("context")
+    if context and uri.startswith("transaction/") and out.get("name_orig"):
+        try:
+            out = with_tx_context(out, context)
+        except Exception as e:
+            # Optional embed: the transaction is still returned, the client fetches KPI/detection itself.
+            print(f"[MCP_HTTP] transaction context skipped: {e}", flush=True)
+    return out
+
+
+def _context_number(context, key, default, cast):
+    """context[key] cast to int/float; missing, null or non-numeric values give the default."""
+    try:
+        return cast(context.get(key, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def with_tx_context(tx, context):
+    """Transaction + KPI of its origin account (step +- kpi_step_window) + detect_suspicious, in one reply.
+
+    Returns a new dict: the cached resource is left untouched.
+    """
+    context = context if isinstance(context, dict) else {}
+    window = _context_number(context, "kpi_step_window", 20, int)
+    step = int(tx.get("step") or 1)
+    name = tx["name_orig"]
+    return dict(
+        tx,
+        kpi=tool_get_account_kpi(name, max(1, step - window), step + window),
+        suspicious=tool_detect_suspicious(
+            name,
+            _context_number(context, "min_amount", 200000.0, float),
+            _context_number(context, "window_steps", 10, int),
+            _context_number(context, "max_rows", 10, int),
+        ),
+    )
+
+
+def rpc_tools_call(params):
+    name = params.get("name") or params.get("tool")
+    fn = TOOL_HANDLERS.get(name)
+    if fn is None:
+        raise RpcError(-32601, f"unknown tool: {name}")
+    args = params.get("arguments") or params.get("params") or {}
+    return fn(**args)
+
+
+TOOL_HANDLERS = {
+    "get_account_kpi": tool_get_account_kpi,
+    "detect_suspicious": tool_detect_suspicious,
+}
+
+METHODS = {
+    "initialize": rpc_initialize,
+    "tools/list": rpc_tools_list,
+    "resources/read": rpc_resources_read,
+    "tools/call": rpc_tools_call,
+}
+
+
+def handle_rpc(req):
+    if not isinstance(req, dict):
+        return jsonrpc_err(None, -32600, "invalid request")
+    _id = req.get("id", 1)
+    handler = METHODS.get(req.get("method"))
+    if handler is None:
+        return jsonrpc_err(_id, -32601, f"unknown method: {req.get('method')}")
+    try:
+        return jsonrpc_ok(_id, handler(req.get("params", {}) or {}))
+    except RpcError as e:
+        return jsonrpc_err(_id, e.code, str(e))
+    except Exception as e:
+        return jsonrpc_err(_id, -32000, str(e))
+
 
 def _json_default(o):
     # Convert Postgres NUMERIC (Decimal) to JSON number
@@ -216,9 +461,31 @@ def _json_default(o):
     raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
 
 
+def json_dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj, default=_json_default)
+    return json.dumps(obj, default=_json_default).encode("utf-8")
+
+
+def json_loads(raw: bytes):
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
 class Handler(BaseHTTPRequestHandler):
+    # Keep-alive: clients reuse one TCP connection across RPCs (every response sets Content-Length).
+    protocol_version = "HTTP/1.1"
+    # Idle keep-alive connections release their thread after this many seconds.
+    timeout = 60
+    # Buffer the response so status line, headers and body leave in a single write
+    # (flushed once per request by handle_one_request).
+    wbufsize = -1
+    # Without TCP_NODELAY, Nagle + delayed ACK can stall keep-alive responses by ~40 ms.
+    disable_nagle_algorithm = True
+
     def _send(self, obj, status=200):
-        data = json.dumps(obj, default=_json_default).encode("utf-8")
+        data = json_dumps(obj)
         self.send_response(status)
         self.send_header("Content-Type", "application/json")
         self.send_header("Content-Length", str(len(data)))
@@ -226,51 +493,34 @@ class Handler(BaseHTTPRequestHandler):
         self.wfile.write(data)
 
     def do_POST(self):
+        # Read the body before any reply: on a keep-alive connection, unread bytes
+        # would be parsed as the next request line.
+        length = int(self.headers.get("Content-Length", "0"))
+        raw = self.rfile.read(length)
         if self.path != "/rpc":
             return self._send({"error": "not found"}, 404)
 
-        length = int(self.headers.get("Content-Length", "0"))
-        raw = self.rfile.read(length).decode("utf-8")
         try:
-            req = json.loads(raw)
+            req = json_loads(raw)
         except Exception:
             return self._send({"error": "invalid json"}, 400)
 
-        _id = req.get("id", 1)
-        method = req.get("method")
-        params = req.get("params", {}) or {}
-
-        try:
-            if method == "initialize":
-                return self._send(jsonrpc_ok(_id, {"server": "mcp-paysim-demo", "version": "0.1", "time": time.strftime("%Y-%m-%dT%H:%M:%S")}))
-
-            if method == "tools/list":
-                return self._send(jsonrpc_ok(_id, {"tools": TOOLS}))
+        # JSON-RPC batch: one POST carries several calls, answered in order.
+        if isinstance(req, list):
+            if not req:
+                return self._send(jsonrpc_err(None, -32600, "invalid request: empty batch"))
+            return self._send([handle_rpc(r) for r in req])
+        return self._send(handle_rpc(req))
 
-            if method == "resources/read":
-                uri = params.get("uri") or params.get("resource")
-                if not uri:
-                    return self._send(jsonrpc_err(_id, -32602, "missing uri"), 200)
-                return self._send(jsonrpc_ok(_id, resource_read(uri)))
 
-            if method == "tools/call":
-                name = params.get("name") or params.get("tool")
-                args = params.get("arguments") or params.get("params") or {}
-                if name == "get_account_kpi":
-                    return self._send(jsonrpc_ok(_id, tool_get_account_kpi(**args)))
-                if name == "detect_suspicious":
-                    return self._send(jsonrpc_ok(_id, tool_detect_suspicious(**args)))
-                return self._send(jsonrpc_err(_id, -32601, f"unknown tool: {name}"), 200)
-
-            return self._send(jsonrpc_err(_id, -32601, f"unknown method: {method}"), 200)
-
-        except Exception as e:
-            return self._send(jsonrpc_err(_id, -32000, str(e)), 200)
+class RpcServer(ThreadingHTTPServer):
+    # The default listen backlog (5) resets connections under bursts of concurrent RPCs.
+    request_queue_size = 128
 
 
 def main():
     print(f"[MCP_HTTP] starting on {HOST}:{PORT} (db={DB_HOST}:{DB_PORT}/{DB_NAME})", flush=True)
-    ThreadingHTTPServer((HOST, PORT), Handler).serve_forever()
+    RpcServer((HOST, PORT), Handler).serve_forever()
 
 
 if __name__ == "__main__":
@@ -1,11 +1,21 @@
 import os
+import random
+import threading
 import time
+from contextlib import contextmanager
 from typing import Any, Dict, List, Optional
 
+# Kept at module level on purpose: every page's first paint needs all of them (MCP probe ->
+# requests, top metrics -> psycopg2, tables -> pandas, which st.dataframe imports anyway),
+# and later sessions find them already in sys.modules, so deferring them would save nothing.
 import pandas as pd
 import requests
+from urllib3.util.retry import Retry
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
 
 
 # Config
@@ -17,16 +27,88 @@ DB_PORT = int(os.getenv("DB_PORT", "5432"))
 DB_NAME = os.getenv("DB_NAME", "paysim")
 DB_USER = os.getenv("DB_USER", "paysim")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "paysim")
+DB_POOL_MIN = int(os.getenv("UI_DB_POOL_MIN", "2"))
+DB_POOL_MAX = int(os.getenv("UI_DB_POOL_MAX", "10"))
+
+# The loaded sample is static between loader runs: DB-derived data is cached this long
+# (sidebar button "Rafraîchir les données" clears it after a reload).
+STATIC_CACHE_TTL_S = int(os.getenv("UI_STATIC_CACHE_TTL_S", "3600"))
+
+# Column layout of MCP results (fixed by the server): frames are built without per-row key inference.
+MATCH_COLUMNS = ["id", "step", "type", "amount", "name_orig", "name_dest", "is_fraud"]
+TYPE_COUNT_COLUMNS = ["type", "cnt"]
+BREAKDOWN_COLUMNS = ["rule", "points", "triggered", "why"]
+
+# Lookup Tx: account KPI computed on the transaction's step ± this many steps.
+LOOKUP_KPI_STEP_WINDOW = 20
+
+# Détection insights: account KPI over the whole sample.
+DETECTION_KPI_STEPS = (1, 200)
 
 # Helpers
 
+@st.cache_resource
+def _http() -> requests.Session:
+    """Shared HTTP session: JSON-RPC calls reuse keep-alive connections to the MCP server."""
+    s = requests.Session()
+    s.headers.update({"Content-Type": "application/json", "Connection": "keep-alive"})
+    # Only connection failures are retried (the request never reached the server): safe for POST.
+    retry = Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.2)
+    adapter = requests.adapters.HTTPAdapter(pool_connections=10, pool_maxsize=10, max_retries=retry)
+    s.mount("http://", adapter)
+    s.mount("https://", adapter)
+    return s
+
+
 def mcp_call(method: str, params: Optional[dict] = None, _id: int = 1, timeout: int = 10) -> Dict[str, Any]:
     payload = {"jsonrpc": "2.0", "id": _id, "method": method, "params": params or {}}
-    r = requests.post(MCP_HTTP_URL, json=payload, timeout=timeout)
+    r = _http().post(MCP_HTTP_URL, json=payload, timeout=timeout)
     r.raise_for_status()
     return r.json()
 
 
+class McpError(Exception):
+    """JSON-RPC error reply raised out of st.cache_data functions, which never cache exceptions.
+
+    A transient server error (pool exhausted, timeout...) is retried on the next rerun
+    instead of being served from the cache; call sites get the reply back from .reply.
+    """
+
+    def __init__(self, reply: Dict[str, Any]):
+        super().__init__(reply["error"].get("message", "MCP error"))
+        self.reply = reply
+
+
+def raise_mcp_error(res: Dict[str, Any]) -> Dict[str, Any]:
+    if "error" in res:
+        raise McpError(res)
+    return res
+
+
+def mcp_reply(fn, *args) -> Dict[str, Any]:
+    """Call a cached MCP helper; an McpError comes back as the error reply it carries."""
+    try:
+        return fn(*args)
+    except McpError as e:
+        return e.reply
+
+
+def mcp_batch(calls: List[tuple], timeout: int = 10) -> List[Dict[str, Any]]:
+    """Send several (method, params) calls in one JSON-RPC batch POST; responses come back in call order."""
+    payload = [
+        {"jsonrpc": "2.0", "id": i, "method": method, "params": params or {}}
+        for i, (method, params) in enumerate(calls)
+    ]
+    r = _http().post(MCP_HTTP_URL, json=payload, timeout=timeout)
+    r.raise_for_status()
+    out = r.json()
+    if not isinstance(out, list):
+        # Server without batch support answers with a single error object.
+        raise ValueError(f"MCP batch not supported: {out}")
+    by_id = {x.get("id"): x for x in out}
+    return [by_id[i] for i in range(len(calls))]
+
+
 def wait_mcp(max_wait_s: float = 8.0) -> bool:
     deadline = time.time() + max_wait_s
     while time.time() < deadline:
@@ -39,179 +121,281 @@ def wait_mcp(max_wait_s: float = 8.0) -> bool:
     return False
 
 
-def db_conn():
-    return psycopg2.connect(
+# Hot queries, prepared once per pooled connection: calls skip parse + plan.
+# account_suggestions is precomputed by the loader (one row per sending account).
+PREPARED_STATEMENTS = {
+    # Two PK index probes: no dependency on the planner's MIN/MAX rewrite (fresh stats after a load).
+    "id_bounds": (
+        "",
+        """
+        SELECT (SELECT id FROM transactions ORDER BY id ASC LIMIT 1),
+               (SELECT id FROM transactions ORDER BY id DESC LIMIT 1)
+        """,
+    ),
+    # First existing id >= target, else the last one below it: two PK index probes.
+    "random_tx_probe": (
+        "bigint",
+        """
+        SELECT COALESCE(
+          (SELECT id FROM transactions WHERE id >= $1 ORDER BY id LIMIT 1),
+          (SELECT id FROM transactions WHERE id < $1 ORDER BY id DESC LIMIT 1)
+        )
+        """,
+    ),
+    "account_stats": (
+        "text",
+        """
+        SELECT nb_out, avg_amt, max_amt, step_min, step_max, p95,
+               nb_risky_out, max_risky_amount, p95_risky_amount
+        FROM account_suggestions
+        WHERE name = $1
+        """,
+    ),
+}
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    # Set once PREPARED_STATEMENTS exist in this session.
+    prepared = False
+
+
+def prepare_statements(conn) -> None:
+    batch = ";".join(
+        f"PREPARE {name}{f' ({argtypes})' if argtypes else ''} AS {sql}"
+        for name, (argtypes, sql) in PREPARED_STATEMENTS.items()
+    )
+    with conn.cursor() as cur:
+        cur.execute(batch)
+    conn.prepared = True
+
+
+@st.cache_resource
+def get_pool() -> psycopg2.pool.ThreadedConnectionPool:
+    """One pool per Streamlit server process: reruns reuse open connections."""
+    return psycopg2.pool.ThreadedConnectionPool(
+        DB_POOL_MIN,
+        DB_POOL_MAX,
         host=DB_HOST,
         port=DB_PORT,
         dbname=DB_NAME,
         user=DB_USER,
         password=DB_PASSWORD,
         connect_timeout=5,
+        connection_factory=PooledConnection,
     )
 
 
-@st.cache_data(ttl=30)
-def list_accounts(limit: int = 500) -> List[str]:
-    """Sample of accounts for the dropdown (read-only)."""
-    conn = db_conn()
+@contextmanager
+def db_conn():
+    pool = get_pool()
+    conn = pool.getconn()
     try:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT name
-                FROM (
-                  SELECT name_orig AS name FROM transactions
-                  UNION
-                  SELECT name_dest AS name FROM transactions
-                ) t
-                WHERE name IS NOT NULL AND name <> ''
-                ORDER BY name
-                LIMIT %s;
-                """,
-                (limit,),
-            )
-            return [r[0] for r in cur.fetchall()]
+        if not conn.prepared:
+            # Read-only queries: no open transaction, so putconn has no implicit ROLLBACK to send.
+            conn.autocommit = True
+            prepare_statements(conn)
+        yield conn
     finally:
-        conn.close()
+        # A connection broken mid-query is dropped instead of being handed to the next rerun.
+        pool.putconn(conn, close=bool(conn.closed))
 
 
-@st.cache_data(ttl=15)
+def _cached(key: str, ttl: float, fn):
+    """Per-session memo in st.session_state: skips st.cache_data hashing/unpickling on every rerun."""
+    now = time.time()
+    entry = st.session_state.get(key)
+    if entry and now - entry[0] < ttl:
+        return entry[1]
+    value = fn()
+    st.session_state[key] = (now, value)
+    return value
+
+
+@st.cache_data(ttl=STATIC_CACHE_TTL_S)
+def list_accounts(limit: int = 500) -> List[str]:
+    """Sample of accounts for the dropdown (read-only)."""
+    with db_conn() as conn, conn.cursor() as cur:
+        cur.execute(
+            """
+            -- account_kpi (built by the loader) already holds one row per account name,
+            -- indexed on name: no dedup sort over transactions at read time.
+            SELECT name
+            FROM account_kpi
+            WHERE name IS NOT NULL AND name <> ''
+            ORDER BY name
+            LIMIT %s;
+            """,
+            (limit,),
+        )
+        return [name for (name,) in cur]
+
+
+@st.cache_data(ttl=STATIC_CACHE_TTL_S)
 def global_overview() -> Dict[str, Any]:
     """Small global overview using SQL (fast)."""
-    conn = db_conn()
-    try:
-        with conn.cursor() as cur:
-            cur.execute("SELECT COUNT(*) FROM transactions;")
-            n = int(cur.fetchone()[0])
-
-            cur.execute("SELECT COUNT(*) FROM transactions WHERE is_fraud = TRUE;")
-            n_fraud = int(cur.fetchone()[0])
-
-            cur.execute("SELECT MIN(step), MAX(step) FROM transactions;")
-            step_min, step_max = cur.fetchone()
-
-            cur.execute(
-                """
-                SELECT type, COUNT(*) AS cnt
-                FROM transactions
-                GROUP BY type
-                ORDER BY cnt DESC
-                LIMIT 10;
-                """
-            )
-            top_types = [{"type": t, "cnt": int(c)} for (t, c) in cur.fetchall()]
-
-        return {
-            "n": n,
-            "n_fraud": n_fraud,
-            "fraud_rate": (n_fraud / n) if n else 0.0,
-            "step_min": int(step_min) if step_min is not None else None,
-            "step_max": int(step_max) if step_max is not None else None,
-            "top_types": top_types,
-        }
-    finally:
-        conn.close()
+    with db_conn() as conn, conn.cursor() as cur:
+        # Pre-aggregated by the loader (transactions_overview_mv / transactions_types_mv): one tiny read.
+        cur.execute(
+            """
+            SELECT
+              o.n, o.n_fraud, o.step_min, o.step_max,
+              (
+                SELECT COALESCE(json_agg(json_build_object('type', type, 'cnt', cnt) ORDER BY cnt DESC), '[]'::json)
+                FROM (SELECT type, cnt FROM transactions_types_mv ORDER BY cnt DESC LIMIT 10) t
+              )
+            FROM transactions_overview_mv o;
+            """
+        )
+        n, n_fraud, step_min, step_max, top_types = cur.fetchone()
+
+    n = int(n)
+    n_fraud = int(n_fraud)
+    top_types = [{"type": x["type"], "cnt": int(x["cnt"])} for x in top_types]
+
+    return {
+        "n": n,
+        "n_fraud": n_fraud,
+        "fraud_rate": (n_fraud / n) if n else 0.0,
+        "step_min": int(step_min) if step_min is not None else None,
+        "step_max": int(step_max) if step_max is not None else None,
+        "top_types": top_types,
+    }
+
+
+@st.cache_data(ttl=STATIC_CACHE_TTL_S)
+def get_id_bounds() -> tuple:
+    """(first id, last id) of transactions, for the Lookup hint and the default ID."""
+    with db_conn() as conn, conn.cursor() as cur:
+        cur.execute("EXECUTE id_bounds")
+        id_min, id_max = cur.fetchone()
+    return (int(id_min) if id_min is not None else 1, int(id_max) if id_max is not None else 1)
+
+
+# --- Per-account outgoing stats (shared by auto-tune + diagnostics) ---
+@st.cache_data(ttl=STATIC_CACHE_TTL_S)
+def account_params_and_risk(account: str) -> Dict[str, Any]:
+    """Outgoing stats for an account, overall and restricted to TRANSFER/CASH_OUT (one indexed row)."""
+    with db_conn() as conn, conn.cursor() as cur:
+        cur.execute("EXECUTE account_stats (%s)", (account,))
+        keys = [d[0] for d in cur.description]
+        row = cur.fetchone()
+    # No row: the account never sends (only appears as name_dest).
+    return dict(zip(keys, row)) if row else dict.fromkeys(keys, 0)
 
 
 # --- Auto-tune detection params per account ---
-@st.cache_data(ttl=60)
 def suggest_detection_params(account: str) -> Dict[str, Any]:
     """Heuristics to propose good detection filters for a given account.
 
     Goal: avoid the user having to guess min_amount/window_steps. Uses fast SQL on the local sample.
     """
-    conn = db_conn()
-    try:
-        with conn.cursor() as cur:
-            # Outgoing activity distribution for this account
-            cur.execute(
-                """
-                SELECT
-                    COUNT(*)::int AS nb_out,
-                    COALESCE(AVG(amount), 0)::float8 AS avg_amt,
-                    COALESCE(MAX(amount), 0)::float8 AS max_amt,
-                    COALESCE(MIN(step), 0)::int AS step_min,
-                    COALESCE(MAX(step), 0)::int AS step_max,
-                    COALESCE(percentile_cont(0.95) WITHIN GROUP (ORDER BY amount), 0)::float8 AS p95
-                FROM transactions
-                WHERE name_orig = %s;
-                """,
-                (account,),
-            )
-            nb_out, avg_amt, max_amt, step_min, step_max, p95 = cur.fetchone()
-
-        nb_out = int(nb_out or 0)
-        avg_amt = float(avg_amt or 0.0)
-        max_amt = float(max_amt or 0.0)
-        p95 = float(p95 or 0.0)
-        step_min = int(step_min or 0)
-        step_max = int(step_max or 0)
-
-        # --- Heuristics ---
-        # min_amount: start from the 95th percentile of outgoing amounts, with sensible floors
-        base = max(p95, avg_amt * 2.0, 50_000.0)
-        if max_amt > 0:
-            base = min(base, max_amt)  # don't propose above max
-
-        # Round to nearest 1k for nicer UX
-        min_amount = float(int(base / 1000.0) * 1000)
-        if min_amount <= 0:
-            min_amount = 50_000.0
-
-        # window_steps: denser accounts => smaller window, sparse accounts => larger window
-        if nb_out >= 30:
-            window_steps = 5
-        elif nb_out >= 10:
-            window_steps = 10
-        else:
-            window_steps = 20
-
-        # Provide context for UI
-        span = max(0, step_max - step_min)
-        density = (nb_out / span) if span > 0 else (float(nb_out) if nb_out else 0.0)
-
-        return {
-            "nb_out": nb_out,
-            "avg_amt": avg_amt,
-            "max_amt": max_amt,
-            "p95": p95,
-            "min_amount": min_amount,
-            "window_steps": int(window_steps),
-            "step_span": span,
-            "density": float(density),
-        }
-    finally:
-        conn.close()
+    stats = account_params_and_risk(account)
+
+    nb_out = int(stats["nb_out"] or 0)
+    avg_amt = float(stats["avg_amt"] or 0.0)
+    max_amt = float(stats["max_amt"] or 0.0)
+    p95 = float(stats["p95"] or 0.0)
+    step_min = int(stats["step_min"] or 0)
+    step_max = int(stats["step_max"] or 0)
+
+    # --- Heuristics ---
+    # min_amount: start from the 95th percentile of outgoing amounts, with sensible floors
+    base = max(p95, avg_amt * 2.0, 50_000.0)
+    if max_amt > 0:
+        base = min(base, max_amt)  # don't propose above max
+
+    # Round to nearest 1k for nicer UX
+    min_amount = float(int(base / 1000.0) * 1000)
+    if min_amount <= 0:
+        min_amount = 50_000.0
+
+    # window_steps: denser accounts => smaller window, sparse accounts => larger window
+    if nb_out >= 30:
+        window_steps = 5
+    elif nb_out >= 10:
+        window_steps = 10
+    else:
+        window_steps = 20
+
+    # Provide context for UI
+    span = max(0, step_max - step_min)
+    density = (nb_out / span) if span > 0 else (float(nb_out) if nb_out else 0.0)
+
+    return {
+        "nb_out": nb_out,
+        "avg_amt": avg_amt,
+        "max_amt": max_amt,
+        "p95": p95,
+        "min_amount": min_amount,
+        "window_steps": int(window_steps),
+        "step_span": span,
+        "density": float(density),
+    }
 
 # --- Helper: stats on risky outgoing operations for diagnostics ---
-@st.cache_data(ttl=60)
 def risky_out_stats(account: str) -> Dict[str, Any]:
     """Stats sur les opérations sortantes 'à risque' (TRANSFER/CASH_OUT) pour expliquer pourquoi il y a (ou non) des matchs."""
-    conn = db_conn()
-    try:
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT
-                    COUNT(*)::int AS nb_risky_out,
-                    COALESCE(MAX(amount), 0)::float8 AS max_risky_amount,
-                    COALESCE(percentile_cont(0.95) WITHIN GROUP (ORDER BY amount), 0)::float8 AS p95_risky_amount
-                FROM transactions
-                WHERE name_orig = %s
-                  AND type IN ('TRANSFER', 'CASH_OUT');
-                """,
-                (account,),
-            )
-            nb_risky_out, max_risky_amount, p95_risky_amount = cur.fetchone()
+    stats = account_params_and_risk(account)
+    return {
+        "nb_risky_out": int(stats["nb_risky_out"] or 0),
+        "max_risky_amount": float(stats["max_risky_amount"] or 0.0),
+        "p95_risky_amount": float(stats["p95_risky_amount"] or 0.0),
+    }
 
-        return {
-            "nb_risky_out": int(nb_risky_out or 0),
-            "max_risky_amount": float(max_risky_amount or 0.0),
-            "p95_risky_amount": float(p95_risky_amount or 0.0),
-        }
-    finally:
-        conn.close()
 
+# get_account_kpi replies that came with a Détection batch (detection_df), handed to
+# get_kpi_cached on its next miss instead of a second POST.
+_kpi_prefetched: Dict[tuple, Dict[str, Any]] = {}
+
+
+def _kpi_args(name: str, step_from: int, step_to: int) -> dict:
+    return {"name": "get_account_kpi", "arguments": {"name": name, "step_from": step_from, "step_to": step_to}}
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def get_kpi_cached(name: str, step_from: int = 1, step_to: int = 200) -> Dict[str, Any]:
+    """KPI compte partagé entre les pages KPI et Détection (pas de second appel MCP en changeant d'onglet)."""
+    res = _kpi_prefetched.pop((name, step_from, step_to), None)
+    if res is None:
+        res = mcp_call("tools/call", _kpi_args(name, step_from, step_to), _id=10)
+    return raise_mcp_error(res)
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def cached_resource_read(tx_id: int) -> Dict[str, Any]:
+    """resources/read d'une transaction (les données chargées ne changent pas entre deux clics).
+
+    context: the server also embeds the origin account's KPI and detection (one round trip);
+    without them in the reply, the Lookup page falls back to lookup_account_context.
+    """
+    context = {"kpi_step_window": LOOKUP_KPI_STEP_WINDOW, "min_amount": 200000.0, "window_steps": 10, "max_rows": 10}
+    return raise_mcp_error(mcp_call("resources/read", {"uri": f"transaction/{tx_id}", "context": context}, _id=30))
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def lookup_account_context(account: str, step_from: int, step_to: int) -> tuple:
+    """(KPI, détection) du compte d'origine d'une transaction, en un seul batch JSON-RPC."""
+    kpi_res, det_res = mcp_batch([
+        ("tools/call", _kpi_args(account, step_from, step_to)),
+        ("tools/call", {"name": "detect_suspicious", "arguments": {"name": account, "min_amount": 200000.0, "window_steps": 10, "max_rows": 10}}),
+    ])
+    return raise_mcp_error(kpi_res), raise_mcp_error(det_res)
+
+
+@st.cache_data(ttl=30, show_spinner=False)
+def detection_df(name: str, min_amount: float, window_steps: int):
+    """Détection d'un compte, avec le DataFrame des matchs déjà construit.
+
+    The account KPI used by the page's insights rides in the same JSON-RPC batch and seeds get_kpi_cached.
+    """
+    res, kpi_res = mcp_batch([
+        ("tools/call", {"name": "detect_suspicious", "arguments": {"name": name, "min_amount": min_amount, "window_steps": window_steps}}),
+        ("tools/call", _kpi_args(name, *DETECTION_KPI_STEPS)),
+    ])
+    if "error" not in kpi_res:
+        _kpi_prefetched[(name, *DETECTION_KPI_STEPS)] = kpi_res
+    raise_mcp_error(res)
+    return pd.DataFrame.from_records(res["result"].get("matches", []), columns=MATCH_COLUMNS), res
 
 
 def risk_badge(n_matches: int, max_amt: float) -> str:
@@ -225,13 +409,34 @@ def risk_badge(n_matches: int, max_amt: float) -> str:
 
 # ----------------- Insights helpers -----------------
 
+# "1,234.50" -> "1 234,50" in a single pass.
+_FR_NUMBER = str.maketrans({",": " ", ".": ","})
+
+
 def fmt_eur(x: float) -> str:
     try:
-        return f"{float(x):,.2f} €".replace(",", " ").replace(".", ",")
+        return f"{float(x):,.2f} €".translate(_FR_NUMBER)
     except Exception:
         return str(x)
 
 
+def _fr_int(n: int) -> str:
+    return f"{n:,}".translate(_FR_NUMBER)
+
+
+def _breakdown_df(breakdown: list) -> pd.DataFrame:
+    """Score breakdown table (rule -> points)."""
+    return pd.DataFrame.from_records(breakdown, columns=BREAKDOWN_COLUMNS)
+
+
+def render_breakdown(ins: Dict[str, Any], key: str) -> None:
+    """Expander "Détail du score": note + table règle -> points, built only once the expander is opened."""
+    with st.expander("🧾 Détail du score (règles)", key=key, on_change="rerun") as exp:
+        if exp.open:
+            st.caption(ins.get("note", ""))
+            st.dataframe(_breakdown_df(ins.get("breakdown", [])), use_container_width=True, hide_index=True)
+
+
 def risk_label(score: int) -> str:
     if score >= 80:
         return "Élevé"
@@ -261,64 +466,7 @@ def build_insights(kpi: dict, suspicious: dict, tx: Optional[dict] = None) -> Di
     min_amount = float((suspicious or {}).get("min_amount", 200000) or 200000)
     window_steps = int((suspicious or {}).get("window_steps", 10) or 10)
 
-    # --- score (0-100) basé sur règles simples
-    breakdown: List[Dict[str, Any]] = []
-    score = 0
-
-    def add_rule(rule: str, pts: int, triggered: bool, why: str) -> None:
-        nonlocal score
-        if triggered:
-            score += pts
-        breakdown.append({"rule": rule, "points": pts if triggered else 0, "triggered": triggered, "why": why})
-
-    # R1 - Volume sortant très concentré
-    add_rule(
-        "Concentration des sorties",
-        25,
-        (nb_out <= 2 and total_out >= min_amount),
-        f"nb_out ≤ 2 et total_out ≥ seuil ({fmt_eur(min_amount)})",
-    )
-
-    # R2 - Montant moyen sortant élevé
-    add_rule(
-        "Montant moyen sortant élevé",
-        20,
-        (avg_out >= min_amount and nb_out > 0),
-        f"avg_out ≥ seuil ({fmt_eur(min_amount)})",
-    )
-
-    # R3 - Détections règles (matches)
-    add_rule(
-        "Au moins 1 match détecté",
-        25,
-        (len(matches) >= 1),
-        f"≥ 1 transaction sortante ≥ {fmt_eur(min_amount)} dans une fenêtre de {window_steps} steps",
-    )
-
-    add_rule(
-        "Plusieurs matchs (≥ 3)",
-        10,
-        (len(matches) >= 3),
-        "≥ 3 transactions détectées avec les paramètres de détection",
-    )
-
-    # R4 - Fraude connue (label dataset)
-    add_rule(
-        "Fraude labellisée (dataset)",
-        25,
-        (fraud_out > 0),
-        "Au moins une transaction sortante est marquée is_fraud=True (donnée simulée PaySim)",
-    )
-
-    # R5 - Déséquilibre entrants/sortants
-    add_rule(
-        "Déséquilibre (aucune entrée)",
-        10,
-        (total_in == 0 and total_out > 0),
-        "total_in = 0 alors que total_out > 0",
-    )
-
-    # R6 - Signal transaction consultée (optionnel)
+    # Points du signal transaction consultée (R6, optionnel)
     tx_points = 0
     tx_reason = []
     if tx:
@@ -338,14 +486,39 @@ def build_insights(kpi: dict, suspicious: dict, tx: Optional[dict] = None) -> Di
             tx_points += 10
             tx_reason.append("montant ≥ seuil")
 
-    add_rule(
-        "Signal sur la transaction consultée",
-        min(tx_points, 20),
-        bool(tx and tx_points > 0),
-        "; ".join(tx_reason) if tx_reason else "",
-    )
+    seuil = fmt_eur(min_amount)
+    n_matches = len(matches)
+
+    # Table des règles: (règle, points, déclenchée, explication)
+    rules = [
+        # R1 - Volume sortant très concentré
+        ("Concentration des sorties", 25, nb_out <= 2 and total_out >= min_amount,
+         f"nb_out ≤ 2 et total_out ≥ seuil ({seuil})"),
+        # R2 - Montant moyen sortant élevé
+        ("Montant moyen sortant élevé", 20, avg_out >= min_amount and nb_out > 0,
+         f"avg_out ≥ seuil ({seuil})"),
+        # R3 - Détections règles (matches)
+        ("Au moins 1 match détecté", 25, n_matches >= 1,
+         f"≥ 1 transaction sortante ≥ {seuil} dans une fenêtre de {window_steps} steps"),
+        ("Plusieurs matchs (≥ 3)", 10, n_matches >= 3,
+         "≥ 3 transactions détectées avec les paramètres de détection"),
+        # R4 - Fraude connue (label dataset)
+        ("Fraude labellisée (dataset)", 25, fraud_out > 0,
+         "Au moins une transaction sortante est marquée is_fraud=True (donnée simulée PaySim)"),
+        # R5 - Déséquilibre entrants/sortants
+        ("Déséquilibre (aucune entrée)", 10, total_in == 0 and total_out > 0,
+         "total_in = 0 alors que total_out > 0"),
+        # R6 - Signal transaction consultée (optionnel)
+        ("Signal sur la transaction consultée", min(tx_points, 20), bool(tx and tx_points > 0),
+         "; ".join(tx_reason) if tx_reason else ""),
+    ]
 
-    score = min(score, 100)
+    # --- score (0-100) basé sur règles simples
+    breakdown: List[Dict[str, Any]] = [
+        {"rule": rule, "points": pts if hit else 0, "triggered": hit, "why": why}
+        for rule, pts, hit, why in rules
+    ]
+    score = min(sum(b["points"] for b in breakdown), 100)
 
     bullets: List[str] = []
     bullets.append(
@@ -420,6 +593,13 @@ with st.sidebar:
     st.header("⚙️ Connexions")
     st.write(f"**MCP**: `{MCP_HTTP_URL}`")
     st.write(f"**DB**: `{DB_HOST}:{DB_PORT}/{DB_NAME}`")
+    if st.button("🔄 Reconnecter MCP"):
+        st.session_state["mcp_ready"] = False
+    if st.button("♻️ Rafraîchir les données"):
+        st.cache_data.clear()
+        st.session_state.pop("ov", None)
+        st.session_state.pop("accounts", None)
+        st.session_state.pop("last_rendered_tx_id", None)
 
     st.divider()
     st.header("🧭 Comment lire l’interface")
@@ -441,137 +621,29 @@ with st.sidebar:
     )
     st.session_state["page_index"] = ["📌 Overview", "📊 KPI Compte", "🚨 Détection", "🔎 Lookup Tx"].index(page)
 
-ready = wait_mcp()
-if not ready:
+# Probe MCP once per session (not on every rerun); the sidebar button forces a re-probe.
+if not st.session_state.get("mcp_ready"):
+    st.session_state["mcp_ready"] = wait_mcp()
+if not st.session_state["mcp_ready"]:
     st.error("Impossible de joindre le MCP. Vérifie `docker compose ps` et que le port 8765 est up.")
     st.stop()
 
 # Top metrics
-ov = global_overview()
+ov = _cached("ov", STATIC_CACHE_TTL_S, global_overview)
 c1, c2, c3, c4 = st.columns(4)
-c1.metric("Transactions (échantillon)", f"{ov['n']:,}".replace(",", " "))
-c2.metric("Fraudes", f"{ov['n_fraud']:,}".replace(",", " "))
+c1.metric("Transactions (échantillon)", _fr_int(ov["n"]))
+c2.metric("Fraudes", _fr_int(ov["n_fraud"]))
 c3.metric("Taux fraude", f"{ov['fraud_rate']*100:.2f}%")
 c4.metric("Steps", f"{ov['step_min']} → {ov['step_max']}")
 
 st.divider()
 
-# --- Navigation logic ---
-PAGES = ["📌 Overview", "📊 KPI Compte", "🚨 Détection", "🔎 Lookup Tx"]
-page = st.session_state.get("page_radio", PAGES[0])
-
-# --- Overview page ---
-if page == "📌 Overview":
-    st.subheader("📌 Overview — Contexte & Objectifs")
-
-    st.markdown(
-        """
-### 🎯 Objectif de la démo
-
-Cette application est une **démo de monitoring fraude bancaire**, pensée comme un **outil de présentation client**.  
-Elle montre comment, à partir de données de transactions brutes, on peut :
-
-- explorer l’activité des comptes,
-- détecter des comportements suspects,
-- expliquer clairement les résultats (insights),
-- sans modèle de Machine Learning complexe.
-
-L’objectif n’est **pas** la performance algorithmique, mais la **lisibilité métier** et la **capacité d’analyse**.
-"""
-    )
-
-    st.markdown(
-        """
-### 📊 Source des données
-
-Les données proviennent du dataset **PaySim** (Kaggle) :
-- Données **synthétiques** simulant des transactions financières réelles,
-- Générées à partir de comportements observés dans des systèmes bancaires,
-- Utilisées très fréquemment pour des démonstrations en **fraude / AML**.
-
-⚠️ Il ne s’agit **pas de données réelles** : la fraude est *labellisée* dans le dataset.
-"""
-    )
-
-    st.markdown(
-        """
-### ✂️ Pourquoi un échantillon de 50 000 lignes ?
-
-Le dataset PaySim complet contient plusieurs **millions de transactions**.  
-Pour cette démo, nous avons volontairement réduit le volume à **50 000 lignes** afin de :
-
-- garantir une exécution fluide sur un **ordinateur personnel (Mac)**,
-- éviter les temps de chargement longs dans PostgreSQL,
-- conserver une **interface Streamlit réactive**,
-- rester focalisé sur l’analyse plutôt que sur l’infrastructure lourde.
-
-👉 Les raisonnements restent **exactement les mêmes** qu’à grande échelle.
-"""
-    )
-
-    st.markdown(
-        """
-### 🧱 Architecture technique (simple mais réaliste)
-
-Cette démo repose sur une architecture volontairement proche d’un contexte professionnel :
-
-- **Docker**  
-  → Isole chaque composant (base de données, serveur MCP)  
-  → Garantit la reproductibilité de l'environnement
-
-- **PostgreSQL**  
-  → Stockage structuré des transactions  
-  → Ajout d’un **ID technique** pour faciliter les recherches transactionnelles
-
-- **Loader Python**  
-  → Chargement contrôlé du CSV vers la base  
-  → Transformation minimale (logique *ELT*)
-
-- **Serveur MCP (HTTP / JSON-RPC)**  
-  → Expose des capacités analytiques sous forme d’API  
-  → KPI compte, détection de règles, lecture transaction
-
-- **Streamlit**  
-  → Interface orientée **utilisateur métier**  
-  → Filtres simples, résultats lisibles, insights automatiques
-
-👉 Cette séparation **UI / API / DB** est exactement ce qu’on retrouve en entreprise.
-"""
-    )
-
-    st.markdown(
-        """
-### 🧭 Comment utiliser l’application
-
-- **Overview**  
-  → Comprendre le périmètre, le volume et les types de transactions
-
-- **KPI Compte**  
-  → Analyser le comportement global d’un compte (entrées / sorties)
-
-- **Détection**  
-  → Identifier des transactions suspectes via des règles simples
-
-- **Lookup Tx**  
-  → Analyser une transaction précise et son contexte compte
-"""
-    )
-
-    st.divider()
-    st.subheader("📈 Répartition des types de transactions")
-
-    df_types = pd.DataFrame(ov["top_types"])
-    st.dataframe(df_types, use_container_width=True, hide_index=True)
-
-    st.info(
-        "PaySim est une donnée **simulée**. Les règles de détection sont volontairement simples afin d’être compréhensibles par un public non technique.",
-        icon="ℹ️",
-    )
-
 # --- KPI Compte page ---
-elif page == "📊 KPI Compte":
+# Fragments: changing a widget on these pages reruns only the page body, not the header/overview.
+@st.fragment
+def kpi_page() -> None:
     st.subheader("📊 KPI Compte")
-    accounts = list_accounts(limit=800)
+    accounts = _cached("accounts", STATIC_CACHE_TTL_S, lambda: list_accounts(limit=800))
     if not accounts:
         st.warning("Aucun compte trouvé (table vide ?).")
         st.info("Astuce: vérifie que le loader a bien inséré des lignes (ex: `SELECT COUNT(*) FROM transactions;`).")
@@ -585,8 +657,7 @@ elif page == "📊 KPI Compte":
         with colC:
             step_to = st.number_input("step_to", min_value=0, value=200, step=1)
 
-        args = {"name": name, "step_from": int(step_from), "step_to": int(step_to)}
-        res = mcp_call("tools/call", {"name": "get_account_kpi", "arguments": args}, _id=10)
+        res = mcp_reply(get_kpi_cached, name, int(step_from), int(step_to))
 
         if "error" in res:
             st.error(res["error"]["message"])
@@ -602,7 +673,7 @@ elif page == "📊 KPI Compte":
             m4.metric("Entrées (total)", fmt_eur(inn["total_in"]))
 
             st.write("Répartition des types (sortants) :")
-            df_top = pd.DataFrame(r.get("top_out_types", []))
+            df_top = pd.DataFrame.from_records(r.get("top_out_types", []), columns=TYPE_COUNT_COLUMNS)
             st.dataframe(df_top, use_container_width=True, hide_index=True)
 
             # Insights (basés uniquement sur les KPI)
@@ -626,16 +697,14 @@ elif page == "📊 KPI Compte":
             for a in ins["next_actions"]:
                 st.markdown(f"- {a}")
 
-            with st.expander("🧾 Détail du score (règles)", expanded=False):
-                st.caption(ins.get("note", ""))
-                df_b = pd.DataFrame(ins.get("breakdown", []))
-                if not df_b.empty:
-                    st.dataframe(df_b, use_container_width=True, hide_index=True)
+            render_breakdown(ins, key="kpi_breakdown")
+
 
 # --- Détection page ---
-elif page == "🚨 Détection":
+@st.fragment
+def detection_page() -> None:
     st.subheader("🚨 Détection (règles simples)")
-    accounts = list_accounts(limit=800)
+    accounts = _cached("accounts", STATIC_CACHE_TTL_S, lambda: list_accounts(limit=800))
     if not accounts:
         st.warning("Aucun compte disponible pour la détection (table vide ?).")
         st.info("Va sur l'onglet Overview pour vérifier le volume, ou relance le loader.")
@@ -686,18 +755,15 @@ elif page == "🚨 Détection":
         with colD:
             st.button("⚡ Auto-ajuster", on_click=request_apply_suggestions)
 
-        res = mcp_call(
-            "tools/call",
-            {"name": "detect_suspicious", "arguments": {"name": name, "min_amount": float(min_amount), "window_steps": int(window_steps)}},
-            _id=20,
-        )
+        try:
+            df, res = detection_df(name, float(min_amount), int(window_steps))
+        except McpError as e:
+            df, res = None, e.reply
 
         if "error" in res:
             st.error(res["error"]["message"])
         else:
             r = res["result"]
-            matches = r.get("matches", [])
-            df = pd.DataFrame(matches)
 
             if df.empty:
                 st.success("Aucun match avec ces paramètres.")
@@ -747,11 +813,7 @@ elif page == "🚨 Détection":
                 st.dataframe(df, use_container_width=True, hide_index=True)
 
             # Insights (KPI + Détection) — même si aucun match
-            kpi_res = mcp_call(
-                "tools/call",
-                {"name": "get_account_kpi", "arguments": {"name": name, "step_from": 1, "step_to": 200}},
-                _id=21,
-            )
+            kpi_res = mcp_reply(get_kpi_cached, name, *DETECTION_KPI_STEPS)
             if "error" not in kpi_res:
                 ins = build_insights(kpi_res["result"], r, tx=None)
                 st.markdown("---")
@@ -759,9 +821,10 @@ elif page == "🚨 Détection":
                 st.markdown(ins["title"])
 
                 # Add score explanation expander
-                with st.expander("❓ Comment le score est calculé ?", expanded=False):
-                    st.markdown(
-                        """
+                with st.expander("❓ Comment le score est calculé ?", key="det_score_help", on_change="rerun") as exp:
+                    if exp.open:
+                        st.markdown(
+                            """
 Le score (**0 à 100**) est un **score explicable** construit par **addition de points**.
 
 - Chaque règle a un nombre de points.
@@ -769,11 +832,9 @@ Le score (**0 à 100**) est un **score explicable** construit par **addition de
 - Le score final est **borné à 100**.
 
 Le tableau ci-dessous montre **quelles règles ont été déclenchées** et **combien de points** elles ont apporté.
-                        """.strip()
-                    )
-                    df_b = pd.DataFrame(ins.get("breakdown", []))
-                    if not df_b.empty:
-                        st.dataframe(df_b, use_container_width=True, hide_index=True)
+                            """.strip()
+                        )
+                        st.dataframe(_breakdown_df(ins.get("breakdown", [])), use_container_width=True, hide_index=True)
 
                 if ins["score"] >= 80:
                     st.error("Risque ÉLEVÉ — intervention recommandée")
@@ -790,13 +851,129 @@ Le tableau ci-dessous montre **quelles règles ont été déclenchées** et **co
                 for a in ins["next_actions"]:
                     st.markdown(f"- {a}")
 
-                with st.expander("🧾 Détail du score (règles)", expanded=False):
-                    df_b = pd.DataFrame(ins.get("breakdown", []))
-                    if not df_b.empty:
-                        st.dataframe(df_b, use_container_width=True, hide_index=True)
+                render_breakdown(ins, key="det_breakdown")
             else:
                 st.info("Impossible de calculer KPI pour ce compte (erreur MCP).")
 
+
+# --- Navigation logic ---
+PAGES = ["📌 Overview", "📊 KPI Compte", "🚨 Détection", "🔎 Lookup Tx"]
+page = st.session_state.get("page_radio", PAGES[0])
+
+# --- Overview page ---
+if page == "📌 Overview":
+    st.subheader("📌 Overview — Contexte & Objectifs")
+
+    st.markdown(
+        """
+### 🎯 Objectif de la démo
+
+Cette application est une **démo de monitoring fraude bancaire**, pensée comme un **outil de présentation client**.  
+Elle montre comment, à partir de données de transactions brutes, on peut :
+
+- explorer l’activité des comptes,
+- détecter des comportements suspects,
+- expliquer clairement les résultats (insights),
+- sans modèle de Machine Learning complexe.
+
+L’objectif n’est **pas** la performance algorithmique, mais la **lisibilité métier** et la **capacité d’analyse**.
+"""
+    )
+
+    st.markdown(
+        """
+### 📊 Source des données
+
+Les données proviennent du dataset **PaySim** (Kaggle) :
+- Données **synthétiques** simulant des transactions financières réelles,
+- Générées à partir de comportements observés dans des systèmes bancaires,
+- Utilisées très fréquemment pour des démonstrations en **fraude / AML**.
+
+⚠️ Il ne s’agit **pas de données réelles** : la fraude est *labellisée* dans le dataset.
+"""
+    )
+
+    st.markdown(
+        """
+### ✂️ Pourquoi un échantillon de 50 000 lignes ?
+
+Le dataset PaySim complet contient plusieurs **millions de transactions**.  
+Pour cette démo, nous avons volontairement réduit le volume à **50 000 lignes** afin de :
+
+- garantir une exécution fluide sur un **ordinateur personnel (Mac)**,
+- éviter les temps de chargement longs dans PostgreSQL,
+- conserver une **interface Streamlit réactive**,
+- rester focalisé sur l’analyse plutôt que sur l’infrastructure lourde.
+
+👉 Les raisonnements restent **exactement les mêmes** qu’à grande échelle.
+"""
+    )
+
+    st.markdown(
+        """
+### 🧱 Architecture technique (simple mais réaliste)
+
+Cette démo repose sur une architecture volontairement proche d’un contexte professionnel :
+
+- **Docker**  
+  → Isole chaque composant (base de données, serveur MCP)  
+  → Garantit la reproductibilité de l'environnement
+
+- **PostgreSQL**  
+  → Stockage structuré des transactions  
+  → Ajout d’un **ID technique** pour faciliter les recherches transactionnelles
+
+- **Loader Python**  
+  → Chargement contrôlé du CSV vers la base  
+  → Transformation minimale (logique *ELT*)
+
+- **Serveur MCP (HTTP / JSON-RPC)**  
+  → Expose des capacités analytiques sous forme d’API  
+  → KPI compte, détection de règles, lecture transaction
+
+- **Streamlit**  
+  → Interface orientée **utilisateur métier**  
+  → Filtres simples, résultats lisibles, insights automatiques
+
+👉 Cette séparation **UI / API / DB** est exactement ce qu’on retrouve en entreprise.
+"""
+    )
+
+    st.markdown(
+        """
+### 🧭 Comment utiliser l’application
+
+- **Overview**  
+  → Comprendre le périmètre, le volume et les types de transactions
+
+- **KPI Compte**  
+  → Analyser le comportement global d’un compte (entrées / sorties)
+
+- **Détection**  
+  → Identifier des transactions suspectes via des règles simples
+
+- **Lookup Tx**  
+  → Analyser une transaction précise et son contexte compte
+"""
+    )
+
+    st.divider()
+    st.subheader("📈 Répartition des types de transactions")
+
+    df_types = pd.DataFrame.from_records(ov["top_types"], columns=TYPE_COUNT_COLUMNS)
+    st.dataframe(df_types, use_container_width=True, hide_index=True)
+
+    st.info(
+        "PaySim est une donnée **simulée**. Les règles de détection sont volontairement simples afin d’être compréhensibles par un public non technique.",
+        icon="ℹ️",
+    )
+
+elif page == "📊 KPI Compte":
+    kpi_page()
+
+elif page == "🚨 Détection":
+    detection_page()
+
 # --- Lookup Tx page ---
 else:
     st.subheader("🔎 Lookup Transaction")
@@ -821,16 +998,8 @@ Pourquoi c'est utile ?
             """
         )
 
-    # Help the user pick a valid ID (IDs may not be continuous in a sample)
-    conn = db_conn()
-    try:
-        with conn.cursor() as cur:
-            cur.execute("SELECT MIN(id), MAX(id) FROM transactions;")
-            id_min, id_max = cur.fetchone()
-            id_min = int(id_min) if id_min is not None else 1
-            id_max = int(id_max) if id_max is not None else 1
-    finally:
-        conn.close()
+    # Help the user pick a valid ID (IDs may not be continuous in a sample).
+    id_min, id_max = get_id_bounds()
 
     st.caption(
         f"Astuce : dans cet échantillon, les IDs existants sont généralement entre **{id_min}** et **{id_max}** (mais peuvent être non continus)."
@@ -838,34 +1007,38 @@ Pourquoi c'est utile ?
 
     # --- Lookup page: session_state initialization for lookup_tx_id
     if "lookup_tx_id" not in st.session_state:
-        # Initialize from DB min id if possible
-        try:
-            conn = db_conn()
-            with conn.cursor() as cur:
-                cur.execute("SELECT MIN(id) FROM transactions;")
-                row = cur.fetchone()
-                st.session_state["lookup_tx_id"] = int(row[0]) if row and row[0] is not None else 1
-        finally:
-            try:
-                conn.close()
-            except Exception:
-                pass
+        st.session_state["lookup_tx_id"] = id_min
 
     # --- Helper for picking a random transaction id
     def pick_random_tx_id() -> None:
         """Pick an existing transaction id and store it in session_state."""
-        try:
-            conn = db_conn()
-            with conn.cursor() as cur:
-                cur.execute("SELECT id FROM transactions ORDER BY random() LIMIT 1;")
-                row = cur.fetchone()
-                if row and row[0] is not None:
-                    st.session_state["lookup_tx_id"] = int(row[0])
-        finally:
+        # Random target in the cached bounds, then a PK index probe (no full scan + sort).
+        lo, hi = get_id_bounds()
+        target = random.randint(lo, hi)
+        with db_conn() as conn, conn.cursor() as cur:
+            cur.execute("EXECUTE random_tx_probe (%s)", (target,))
+            row = cur.fetchone()
+            if row and row[0] is not None:
+                st.session_state["lookup_tx_id"] = int(row[0])
+        st.session_state["last_rendered_tx_id"] = None
+        prefetch_tx()
+
+    def prefetch_tx() -> None:
+        """Warm cached_resource_read for the selected ID in the background: ready when the user clicks."""
+        st.session_state["last_rendered_tx_id"] = None
+        tx_id = st.session_state.get("lookup_tx_id")
+        if tx_id is None:
+            return
+
+        def _warm() -> None:
             try:
-                conn.close()
+                cached_resource_read(tx_id)
             except Exception:
-                pass
+                pass  # the click path reports MCP errors
+
+        t = threading.Thread(target=_warm, daemon=True)
+        add_script_run_ctx(t, get_script_run_ctx())
+        t.start()
 
     c1, c2, c3 = st.columns([1, 1, 2])
     with c1:
@@ -874,15 +1047,23 @@ Pourquoi c'est utile ?
             min_value=1,
             step=1,
             key="lookup_tx_id",
+            on_change=prefetch_tx,
         )
     with c2:
         st.button("🎲 ID au hasard", on_click=pick_random_tx_id)
     with c3:
         run_lookup = st.button("🔍 Lire la transaction", type="primary")
 
+    # Opening a raw-JSON expander reruns the script: keep showing the transaction read for this ID.
+    tid = st.session_state["lookup_tx_id"]
     if run_lookup:
+        st.session_state["lookup_shown_tx_id"] = tid
+
+    if st.session_state.get("lookup_shown_tx_id") == tid:
         try:
-            res = mcp_call("resources/read", {"uri": f"transaction/{int(st.session_state['lookup_tx_id'])}"}, _id=30)
+            res = cached_resource_read(tid)
+        except McpError as e:
+            res = e.reply
         except Exception as e:
             st.error(f"Erreur lors de l'appel MCP: {e}")
             res = None
@@ -893,35 +1074,53 @@ Pourquoi c'est utile ?
             st.warning(
                 "Transaction introuvable pour cet ID. Essaie un autre ID (les IDs ne sont pas forcément continus)."
             )
-            st.json(res)
+            # Lazy: the raw payload is only serialized and sent once the user opens the expander.
+            with st.expander("Voir la réponse MCP brute", key="lookup_raw_error", on_change="rerun") as raw:
+                if raw.open:
+                    st.json(res)
         else:
-            tx = res["result"]
+            tx = dict(res["result"])
+            # Embedded by the server (see cached_resource_read); kept out of the raw transaction JSON.
+            kpi, suspicious = tx.pop("kpi", None), tx.pop("suspicious", None)
             st.success("Transaction chargée.")
-            st.json(tx)
+            with st.expander("Voir le JSON brut", key="lookup_raw_tx", on_change="rerun") as raw:
+                if raw.open:
+                    st.json(tx)
 
             # Contextual deep-dive: KPI + detection on the origin account
             account = tx.get("name_orig")
             if account:
-                kpi_res = mcp_call(
-                    "tools/call",
-                    {"name": "get_account_kpi", "arguments": {"name": account, "step_from": 1, "step_to": 200}},
-                    _id=31,
-                )
-                det_res = mcp_call(
-                    "tools/call",
-                    {"name": "detect_suspicious", "arguments": {"name": account, "min_amount": 200000.0, "window_steps": 10, "max_rows": 10}},
-                    _id=32,
-                )
-
-                if "error" not in kpi_res and "error" not in det_res:
-                    ins = build_insights(kpi_res["result"], det_res["result"], tx=tx)
+                if st.session_state.get("last_rendered_tx_id") == tid:
+                    # Same transaction as the last render: reuse its insights, no cache probe / MCP call.
+                    ins = st.session_state["last_ins"]
+                else:
+                    if kpi is not None and suspicious is not None:
+                        kpi_res, det_res = {"result": kpi}, {"result": suspicious}
+                    else:
+                        step = int(tx.get("step", 1) or 1)
+                        step_from, step_to = max(1, step - LOOKUP_KPI_STEP_WINDOW), step + LOOKUP_KPI_STEP_WINDOW
+                        try:
+                            kpi_res, det_res = lookup_account_context(account, step_from, step_to)
+                        except McpError as e:
+                            kpi_res = det_res = e.reply
+                        except (requests.RequestException, ValueError, KeyError) as e:
+                            kpi_res = det_res = {"error": {"message": str(e)}}
+
+                    ins = None
+                    if "error" not in kpi_res and "error" not in det_res:
+                        ins = build_insights(kpi_res["result"], det_res["result"], tx=tx)
+                        st.session_state["last_ins"] = ins
+                        st.session_state["last_rendered_tx_id"] = tid
+
+                if ins is not None:
                     st.markdown("---")
                     st.subheader("🧠 Insights automatiques")
                     st.markdown(ins["title"])
 
-                    if ins["score"] >= 80:
+                    score = ins["score"]
+                    if score >= 80:
                         st.error("Risque ÉLEVÉ — intervention recommandée")
-                    elif ins["score"] >= 50:
+                    elif score >= 50:
                         st.warning("Risque MODÉRÉ — contrôle conseillé")
                     else:
                         st.success("Risque FAIBLE — surveillance standard")
@@ -933,19 +1132,9 @@ Pourquoi c'est utile ?
                     st.markdown("### Actions recommandées")
                     for a in ins["next_actions"]:
                         st.markdown(f"- {a}")
-                    with st.expander("🧾 Détail du score (règles)", expanded=False):
-                        st.caption(ins.get("note", ""))
-                        df_b = pd.DataFrame(ins.get("breakdown", []))
-                        if not df_b.empty:
-                            st.dataframe(df_b, use_container_width=True, hide_index=True)
+                    render_breakdown(ins, key="lookup_breakdown")
                 else:
                     st.info("Impossible de calculer KPI/Détection pour cette transaction (erreur MCP).")
-                # Add breakdown expander after next_actions
-                    with st.expander("🧾 Détail du score (règles)", expanded=False):
-                        st.caption(ins.get("note", ""))
-                        df_b = pd.DataFrame(ins.get("breakdown", []))
-                        if not df_b.empty:
-                            st.dataframe(df_b, use_container_width=True, hide_index=True)
             else:
                 st.info("Pas de compte d'origine (name_orig) sur cette transaction.")
 